@@ -1,248 +1,813 @@
 import os
+import html
+import time
+import queue
 import asyncio
+import logging
+import logging.handlers
 from datetime import datetime, timedelta, timezone
 
 import asyncpg
-from zoneinfo import ZoneInfo
+from cachetools import TTLCache
+
+try:
+    import uvloop
+except ImportError:  # Windows yoki o‘rnatilmagan -> oddiy asyncio loop
+    uvloop = None
 
 from telegram import Update
 from telegram.constants import ParseMode
-from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
+from telegram.error import BadRequest, ChatMigrated, Forbidden, RetryAfter
+from telegram.request import HTTPXRequest
+from telegram.ext import AIORateLimiter, ApplicationBuilder, CommandHandler, ContextTypes, MessageHandler, filters
 
 # ====== SETTINGS ======
 REMIND_DAYS = [1, 3, 7, 30]  # siz xohlagan: 1/3/7/30
-CHECK_EVERY_SECONDS = 15     # worker DB ni tekshiradi
-TZ_LOCAL = ZoneInfo("Asia/Tashkent")  # GMT+5
+MAX_SLEEP_SECONDS = 3600     # worker keyingi eslatmani kutishining yuqori chegarasi
+ERROR_RETRY_SECONDS = 15     # worker xatodan keyin qayta urinadi
+DUE_BATCH_SIZE = 100         # worker bitta claim'da nechta eslatma oladi (bir chat'niki bitta xabarga)
+MESSAGE_LIMIT = 4096         # Telegram xabar uzunligi chegarasi
+SEND_RATE_PER_SECOND = 30    # Telegram: ~30 msg/s global limit (AIORateLimiter shu tezlikda ushlab turadi)
+MAX_SEND_RETRIES = 3         # yuborilmagan eslatma necha marta qayta navbatga qo‘yiladi
+RETRY_BASE_SECONDS = 60      # qayta urinish oralig‘i: 60s, 120s, 240s ... (attempts bo‘yicha)
+RETRY_JITTER_SECONDS = 30    # har qatorga tasodifiy qo‘shimcha -> requeue bo‘lganlar birga qaytib kelmaydi
+NOTIFY_CHANNEL = "reminders_new"  # INSERT trigger worker'ni shu kanal orqali uyg‘otadi
+MAX_BULK_TOPICS = 500        # /add_many bitta so‘rovda qabul qiladigan mavzular soni
+MAX_BULK_FILE_BYTES = 256 * 1024  # /add_many fayl hajmi chegarasi
+MAX_TOPIC_CHARS = 3500       # Telegram xabari 4096 belgi: shablon + mavzu sig‘ishi kerak
+SENT_RETENTION_DAYS = 30     # yuborilgan eslatmalar shuncha kundan keyin o‘chiriladi
+FAILED_RETENTION_DAYS = 90   # yetkazilmaganlar (failed_at) tekshirish uchun uzoqroq turadi
+PURGE_EVERY_SECONDS = 86400  # worker eskilarni kuniga bir marta tozalaydi
+PURGE_BATCH_SIZE = 5000      # bitta DELETE nechta qator o‘chiradi (command_timeout ga sig‘sin)
+PENDING_CACHE_SECONDS = 5    # /list birinchi sahifasi shuncha sekund xotirada turadi
+LIST_PAGE_SIZE = 20          # /list bitta xabarda (4096 belgi) nechta qator
+SCHEMA_VERSION = 6           # yangi migrate qo‘shilsa oshiriladi (ensure_schema)
+TZ_NAME = "Asia/Tashkent"    # GMT+5 (vaqtni Postgres o‘zi shu zonada formatlaydi)
+
+# Worker yuboradigan xabar shabloni (har safar f-string qurilmaydi)
+REMINDER_FMT = (
+    "⏰ <b>Takrorlash vaqti!</b>\n"
+    "📌 <b>{d} kun</b> eslatma\n"
+    "🗓 <b>{when}</b>\n\n"
+    "📝 {text}"
+).format
 
 BOT_TOKEN = os.getenv("BOT_TOKEN", "").strip()
 DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))  # handlerlar uchun; worker ulanishi alohida +1
+
+# Webhook (USE_WEBHOOK=1): Telegram update'larni o‘zi yuboradi, polling yo‘q
+USE_WEBHOOK = os.getenv("USE_WEBHOOK", "").strip() == "1"
+PUBLIC_URL = os.getenv("PUBLIC_URL", "").strip().rstrip("/")
+PORT = int(os.getenv("PORT", "8080"))
+
+# ====== SQL ======
+# Matnlar o‘zgarmas -> asyncpg har bir ulanishda prepared statement'ni cache'dan oladi
+# remind_at ni DB hisoblaydi: NOW() transaction vaqti -> hamma qatorlar uchun bir xil
+# days emas hours: kalendar kuni session TimeZone'ga (DST) bog‘liq, bizga aniq d×24 soat kerak
+# (bulk_add dagi timedelta(days=d) bilan bir xil)
+INSERT_SQL = """
+INSERT INTO reminders(chat_id, text, days_after, remind_at, sent)
+VALUES($1::bigint, $2::text, $3::int, NOW() + make_interval(hours => 24 * $3::int), FALSE)
+"""
+
+# Har bir mavzu (text) uchun faqat eng yaqin pending eslatma.
+# Sahifalash keyset bilan: (remind_at, id) > kursor ($2, $3), OFFSET yo‘q
+PENDING_SQL = """
+SELECT id, text, days_after, remind_at, extract(epoch FROM shown_at)::bigint AS ts,
+       to_char(shown_at AT TIME ZONE $5::text, 'DD.MM.YYYY HH24:MI') AS remind_local
+FROM (
+    SELECT DISTINCT ON (text) id, text, days_after, remind_at, COALESCE(scheduled_at, remind_at) AS shown_at
+    FROM reminders
+    WHERE chat_id = $1::bigint AND sent = FALSE
+    ORDER BY text, remind_at ASC
+) nearest
+WHERE $2::timestamptz IS NULL OR (remind_at, id) > ($2::timestamptz, $3::bigint)
+ORDER BY remind_at ASC, id ASC
+LIMIT $4::int
+"""
+
+# /next: bitta index probe (idx_reminders_chat_pending), hamma qatorni olib kelmaymiz
+# Ko‘rsatiladigan vaqt: scheduled_at (requeue bo‘lgan bo‘lsa asl vaqt), bo‘lmasa remind_at
+NEXT_PENDING_SQL = """
+SELECT text, days_after, extract(epoch FROM COALESCE(scheduled_at, remind_at))::bigint AS ts,
+       to_char(COALESCE(scheduled_at, remind_at) AT TIME ZONE $2::text, 'DD.MM.YYYY HH24:MI') AS remind_local
+FROM reminders
+WHERE chat_id = $1::bigint AND sent = FALSE
+ORDER BY remind_at ASC
+LIMIT 1
+"""
+
+DUE_SQL = """
+WITH cte AS (
+    SELECT id, chat_id, text, days_after, remind_at, scheduled_at
+    FROM reminders
+    WHERE sent = FALSE AND remind_at <= LEAST(NOW(), $3::timestamptz)
+    ORDER BY remind_at ASC, chat_id  -- bir chat'niki bitta batch'ga tushsin
+    LIMIT $2::int
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE reminders r
+SET sent = TRUE, sent_at = NOW()
+FROM cte
+WHERE r.id = cte.id
+RETURNING cte.id, cte.chat_id, cte.text, cte.days_after,
+          to_char(COALESCE(cte.scheduled_at, cte.remind_at) AT TIME ZONE $1::text, 'DD.MM.YYYY HH24:MI') AS remind_local
+"""
+
+# Qayta navbat: remind_at keyingi urinish vaqtiga suriladi, asl vaqt scheduled_at da qoladi.
+# counted=FALSE (RetryAfter/flood): attempts oshmaydi, faqat Telegram aytgan vaqtcha kutiladi.
+REQUEUE_SQL = """
+UPDATE reminders r
+SET sent = FALSE, sent_at = NULL,
+    attempts = r.attempts + q.counted::int,
+    scheduled_at = COALESCE(r.scheduled_at, r.remind_at),
+    remind_at = NOW() + make_interval(secs =>
+        GREATEST(q.delay, q.counted::int * $4::float8 * power(2, r.attempts)) + random() * $5::float8)
+FROM unnest($1::bigint[], $2::float8[], $3::bool[]) AS q(id, delay, counted)
+WHERE r.id = q.id AND (NOT q.counted OR r.attempts < $6::int)
+"""
+
+# Qayta navbatga tushmaganlar (doimiy xato yoki urinishlar tugagan) -> yuborilganlardan ajralib turadi
+GIVE_UP_SQL = """
+UPDATE reminders
+SET failed_at = NOW()
+WHERE id = ANY($1::bigint[]) AND sent = TRUE AND failed_at IS NULL
+"""
+
+NEXT_DUE_SQL = "SELECT MIN(remind_at) FROM reminders WHERE sent = FALSE"
+
+# sent_at eski versiyalarda bo‘sh bo‘lishi mumkin -> remind_at bilan
+# failed_at bo‘lganlar (yetkazilmagan) FAILED_RETENTION_DAYS gacha qoladi.
+# Bo‘laklar id bo‘yicha oldinga siljiydi ($3 = oldingi bo‘lakning oxirgi id si):
+# har DELETE jadvalni boshidan qayta skan qilmaydi (PK index bo‘yicha davom etadi)
+PURGE_SQL = """
+WITH batch AS (
+    SELECT id FROM reminders
+    WHERE id > $3::bigint AND sent = TRUE
+      AND (
+          (failed_at IS NULL AND COALESCE(sent_at, remind_at) < NOW() - make_interval(days => $1::int))
+          OR failed_at < NOW() - make_interval(days => $2::int)
+      )
+    ORDER BY id
+    LIMIT $4::int
+), deleted AS (
+    DELETE FROM reminders r USING batch WHERE r.id = batch.id
+)
+SELECT COUNT(*)::int AS n, MAX(id) AS last_id FROM batch
+"""
+
+logger = logging.getLogger("repeatbot")
 
 pool: asyncpg.Pool | None = None
+worker_task: asyncio.Task | None = None  # post_stop uni to‘xtatadi (ulanishni ushlab turadi)
+# chat_id -> /list birinchi sahifa qatorlari (add va worker o‘chiradi)
+pending_cache: TTLCache = TTLCache(maxsize=10_000, ttl=PENDING_CACHE_SECONDS)
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Loglar navbatga tushadi, stdout'ga alohida thread yozadi -> event loop stdio'da to‘xtamaydi."""
+    q = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    # basicConfig emas: u QueueHandler'ga o‘z formatini beradi -> prefiks ikki marta chiqadi
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(q))
+    root.setLevel(logging.INFO)
+    # httpx har bir so‘rovni INFO'da yozadi (URL ichida token bor)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    listener = logging.handlers.QueueListener(q, handler)
+    listener.start()
+    return listener
 
 
 def now_utc() -> datetime:
     return datetime.now(timezone.utc)
 
 
-def to_local(dt_utc: datetime) -> datetime:
-    # dt_utc timezone-aware bo‘lishi shart (UTC)
-    return dt_utc.astimezone(TZ_LOCAL)
+def human_left(ts: int, now_ts: int | None = None) -> str:
+    """Qolgan vaqtni “kun/soat” ko‘rinishda qaytaradi.
+       now_ts ni chaqiruvchi bir marta hisoblab uzatadi (har qator uchun soat o‘qilmaydi).
+    """
+    if now_ts is None:
+        now_ts = int(time.time())
+    total_seconds = ts - now_ts
+    if total_seconds < 0:
+        return "hozir"
+    days, rem = divmod(total_seconds, 86400)
+    hours = rem // 3600
+    if days > 0:
+        return f"{days} kun {hours} soat"
+    return f"{hours} soat"
 
 
 async def ensure_schema():
-    """Table/columns/indexlar bo‘lmasa yaratadi (avtomatik migrate)."""
+    """Table/columns/indexlar bo‘lmasa yaratadi (avtomatik migrate).
+       Versiya bot_meta'da turadi -> ALTER'lar har boot'da emas, bir marta ishlaydi.
+    """
     global pool
     assert pool is not None
 
     async with pool.acquire() as conn:
-        # Table
-        await conn.execute("""
-        CREATE TABLE IF NOT EXISTS reminders (
-            id BIGSERIAL PRIMARY KEY,
-            chat_id BIGINT NOT NULL,
-            text TEXT NOT NULL,
-            days_after INT NOT NULL,
-            remind_at TIMESTAMPTZ NOT NULL,
-            sent BOOLEAN NOT NULL DEFAULT FALSE,
-            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-            sent_at TIMESTAMPTZ NULL
-        );
-        """)
-
-        # Eski versiyadan qolgan bo‘lishi mumkin: columnlar yo‘q bo‘lsa qo‘shib qo‘yamiz
-        await conn.execute("ALTER TABLE reminders ADD COLUMN IF NOT EXISTS days_after INT;")
-        await conn.execute("ALTER TABLE reminders ADD COLUMN IF NOT EXISTS remind_at TIMESTAMPTZ;")
-        await conn.execute("ALTER TABLE reminders ADD COLUMN IF NOT EXISTS sent BOOLEAN NOT NULL DEFAULT FALSE;")
-        await conn.execute("ALTER TABLE reminders ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT NOW();")
-        await conn.execute("ALTER TABLE reminders ADD COLUMN IF NOT EXISTS sent_at TIMESTAMPTZ;")
-
-        # Indexlar (remind_at_epoch ishlatmaymiz!)
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(sent, remind_at);")
-        await conn.execute("CREATE INDEX IF NOT EXISTS idx_reminders_chat ON reminders(chat_id, sent, remind_at);")
+        # Bir nechta instance birga boot bo‘lsa -> migrate navbat bilan
+        try:
+            await conn.execute("""
+            SELECT pg_advisory_lock(hashtext('reminders_schema'));
+            CREATE TABLE IF NOT EXISTS bot_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """)
+            version = await conn.fetchval("SELECT value::int FROM bot_meta WHERE key = 'schema_version';") or 0
+            if version >= SCHEMA_VERSION:
+                return
+
+            async with conn.transaction():
+                if version < 1:
+                    await migrate_v1(conn)
+                if version < 2:
+                    await migrate_v2(conn)
+                if version < 3:
+                    await migrate_v3(conn)
+                if version < 4:
+                    await migrate_v4(conn)
+                if version < 5:
+                    await migrate_v5(conn)
+                if version < 6:
+                    await migrate_v6(conn)
+
+                await conn.execute(
+                    """
+                    INSERT INTO bot_meta(key, value) VALUES('schema_version', $1)
+                    ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+                    """,
+                    str(SCHEMA_VERSION)
+                )
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(hashtext('reminders_schema'));")
+
+
+# Har bir migrate bitta script: execute() argumentsiz -> simple query, bitta round-trip
+async def migrate_v1(conn):
+    await conn.execute("""
+    CREATE TABLE IF NOT EXISTS reminders (
+        id BIGSERIAL PRIMARY KEY,
+        chat_id BIGINT NOT NULL,
+        text TEXT NOT NULL,
+        days_after INT NOT NULL,
+        remind_at TIMESTAMPTZ NOT NULL,
+        sent BOOLEAN NOT NULL DEFAULT FALSE,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        sent_at TIMESTAMPTZ NULL,
+        attempts INT NOT NULL DEFAULT 0
+    );
+
+    -- Eski versiyadan qolgan bo‘lishi mumkin: columnlar yo‘q bo‘lsa qo‘shib qo‘yamiz
+    ALTER TABLE reminders ADD COLUMN IF NOT EXISTS days_after INT;
+    ALTER TABLE reminders ADD COLUMN IF NOT EXISTS remind_at TIMESTAMPTZ;
+    ALTER TABLE reminders ADD COLUMN IF NOT EXISTS sent BOOLEAN NOT NULL DEFAULT FALSE;
+    ALTER TABLE reminders ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+    ALTER TABLE reminders ADD COLUMN IF NOT EXISTS sent_at TIMESTAMPTZ;
+    ALTER TABLE reminders ADD COLUMN IF NOT EXISTS attempts INT NOT NULL DEFAULT 0;
+
+    -- Indexlar (remind_at_epoch ishlatmaymiz!)
+    -- Worker faqat sent=FALSE larni ko‘radi -> partial index yuborilganlar tarixi bilan o‘smaydi
+    DROP INDEX IF EXISTS idx_reminders_due;
+    CREATE INDEX IF NOT EXISTS idx_reminders_due_pending ON reminders(remind_at) WHERE sent = FALSE;
+    CREATE INDEX IF NOT EXISTS idx_reminders_chat ON reminders(chat_id, sent, remind_at);
+    """)
+
+
+async def migrate_v2(conn):
+    # Har qanday INSERT (executemany, COPY, qo‘lda) commit bo‘lganda worker uyg‘onadi
+    await conn.execute(f"""
+    CREATE OR REPLACE FUNCTION notify_reminders_new() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{NOTIFY_CHANNEL}', '');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS reminders_notify ON reminders;
+    CREATE TRIGGER reminders_notify
+    AFTER INSERT ON reminders
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_reminders_new();
+    """)
+
+
+async def migrate_v3(conn):
+    await conn.execute("""
+    -- /list ham faqat sent=FALSE ni o‘qiydi -> chat index ham partial
+    DROP INDEX IF EXISTS idx_reminders_chat;
+    CREATE INDEX IF NOT EXISTS idx_reminders_chat_pending ON reminders(chat_id, remind_at) WHERE sent = FALSE;
+
+    -- Planner yangi indexlar uchun statistikani ko‘rsin
+    ANALYZE reminders;
+    """)
+
+
+async def migrate_v4(conn):
+    await conn.execute("""
+    -- Har bir yuborish UPDATE -> dead tuple. Autovacuum jadvalning 20% emas, 5% i o‘zgarganda ishlasin:
+    -- kichik-kichik vacuum, katta pauza yo‘q, bo‘sh joy qayta ishlatiladi
+    ALTER TABLE reminders SET (
+        autovacuum_vacuum_scale_factor = 0.05,
+        autovacuum_analyze_scale_factor = 0.02
+    );
+    """)
+
+
+async def migrate_v5(conn):
+    await conn.execute("""
+    -- Yetkazib bo‘lmagan eslatmalar: sent=TRUE + failed_at (yuborilganlar bilan aralashmaydi)
+    ALTER TABLE reminders ADD COLUMN IF NOT EXISTS failed_at TIMESTAMPTZ;
+    """)
+
+
+async def migrate_v6(conn):
+    await conn.execute("""
+    -- Requeue remind_at ni suradi; foydalanuvchiga asl rejalashtirilgan vaqt ko‘rsatiladi
+    ALTER TABLE reminders ADD COLUMN IF NOT EXISTS scheduled_at TIMESTAMPTZ;
+    """)
 
 
 async def add_reminders(chat_id: int, text: str):
     global pool
     assert pool is not None
 
-    created = 0
+    # Hamma eslatmalar bitta executemany bilan (1 round-trip)
+    rows = [(chat_id, text, d) for d in REMIND_DAYS]
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.executemany(INSERT_SQL, rows)
+    return len(rows)
+
+
+async def bulk_add(chat_id: int, texts: list[str]):
+    """Ko‘p mavzuni birdan qo‘shadi: COPY -> bitta round-trip, qator uchun Parse/Bind yo‘q."""
+    global pool
+    assert pool is not None
+
     base = now_utc()
+    records = [(chat_id, t, d, base + timedelta(days=d)) for t in texts for d in REMIND_DAYS]
     async with pool.acquire() as conn:
         async with conn.transaction():
-            for d in REMIND_DAYS:
-                remind_at = base + timedelta(days=d)  # UTC aware
-                await conn.execute(
-                    """
-                    INSERT INTO reminders(chat_id, text, days_after, remind_at, sent)
-                    VALUES($1, $2, $3, $4, FALSE)
-                    """,
-                    chat_id, text, d, remind_at
-                )
-                created += 1
-    return created
+            await conn.copy_records_to_table(
+                "reminders",
+                records=records,
+                columns=["chat_id", "text", "days_after", "remind_at"]
+            )
+    return len(records)
 
 
-async def fetch_pending(chat_id: int, limit: int = 50):
+async def fetch_pending(chat_id: int, after=None):
+    """after: oldingi sahifaning oxirgi (remind_at, id) si yoki None (boshidan).
+       LIST_PAGE_SIZE + 1 qator qaytaradi: keyingi sahifa bor-yo‘qligini bilish uchun.
+    """
     global pool
     assert pool is not None
 
+    if after is None:
+        rows = pending_cache.get(chat_id)
+        if rows is not None:
+            return rows
+
+    after_at, after_id = after or (None, None)
     async with pool.acquire() as conn:
-        rows = await conn.fetch(
-            """
-            SELECT id, text, days_after, remind_at, sent
-            FROM reminders
-            WHERE chat_id = $1 AND sent = FALSE
-            ORDER BY remind_at ASC
-            LIMIT $2
-            """,
-            chat_id, limit
-        )
+        rows = await conn.fetch(PENDING_SQL, chat_id, after_at, after_id, LIST_PAGE_SIZE + 1, TZ_NAME)
+
+    if after is None:
+        pending_cache[chat_id] = rows
     return rows
 
 
-async def reminder_worker(app):
-    """DB dan due bo‘lgan reminderlarni olib, yuboradi va sent=true qiladi.
+async def next_pending_row(chat_id: int):
+    global pool
+    assert pool is not None
+
+    async with pool.acquire() as conn:
+        return await conn.fetchrow(NEXT_PENDING_SQL, chat_id, TZ_NAME)
+
+
+async def send_due(app, conn):
+    """Due bo‘lganlarni tugaguncha yuboradi.
+       Pipeline: batch N Telegram'ga ketayotganda batch N+1 DB dan claim qilinadi.
+       Tezlikni AIORateLimiter ushlaydi: batch 30 msg/s dan tez yuborilmaydi.
+    """
+    # Faqat drain boshlanguncha due bo‘lganlar -> shu drain'da requeue bo‘lganlar qayta olinmaydi
+    cutoff = now_utc()
+    sending = None  # yuborilayotgan batch (task)
+    try:
+        while True:
+            rows = await claim_due(conn, cutoff)
+            if sending is not None:
+                # shield: worker cancel bo‘lsa ham deliver task o‘zi to‘xtamaydi
+                failed = await asyncio.shield(sending)
+                await requeue(conn, *failed)
+                sending = None  # requeue tugagandan keyin: aks holda finally qayta urinadi
+            if not rows:
+                return
+            sending = asyncio.create_task(deliver(app, rows))
+            if len(rows) < DUE_BATCH_SIZE:
+                return  # backlog tugadi
+    finally:
+        # Claim qilingan batch yarim yo‘lda tashlab ketilmaydi (xato yoki cancel bo‘lsa ham)
+        if sending is not None:
+            failed = await asyncio.shield(sending)
+            await requeue(conn, *failed)
+
+
+async def claim_due(conn, cutoff: datetime):
+    """Due bo‘lganlarni lock qilib oladi va sent=true qiladi.
        FOR UPDATE SKIP LOCKED -> dubl yuborishni kesadi (2 instance bo‘lsa ham).
     """
+    async with conn.transaction():
+        rows = await conn.fetch(DUE_SQL, TZ_NAME, DUE_BATCH_SIZE, cutoff)
+
+    # Yuborilganlar /list dan chiqadi -> cache eskirdi
+    for r in rows:
+        pending_cache.pop(r["chat_id"], None)
+    return rows
+
+
+async def deliver(app, rows) -> tuple[list[int], dict[int, float], list[int]]:
+    """Batch'ni parallel yuboradi.
+       Qaytaradi: (tarmoq xatosi id lari, RetryAfter {id: retry_after}, doimiy xato id lari).
+    """
+    # Bir xil (text, kun, vaqt) -> xabar bir marta escape/format qilinadi
+    bodies = {}
+    by_chat: dict[int, list] = {}
+    for r in rows:
+        key = (r["text"], r["days_after"], r["remind_local"])
+        body = bodies.get(key)
+        if body is None:
+            # remind_local ni DB o‘zi mahalliy vaqtda formatlab beradi
+            body = bodies[key] = REMINDER_FMT(d=key[1], when=key[2], text=html.escape(key[0]))
+        by_chat.setdefault(r["chat_id"], []).append((r, body))
+
+    # Chat'lar parallel, bitta chat ichida ketma-ket (Telegram: chat uchun ~1 msg/s)
+    per_chat = await asyncio.gather(*(send_chat(app, chat_id, items) for chat_id, items in by_chat.items()))
+
+    retry, flood, dead = [], {}, []
+    for r, res in (pair for results in per_chat for pair in results):
+        if res is None:
+            continue
+        logger.warning("Send error chat_id=%s: %r", r["chat_id"], res)
+        if isinstance(res, RetryAfter):
+            # Flood limit -> xato emas, Telegram aytgan vaqtdan keyin yana
+            flood[r["id"]] = float(res.retry_after)
+        elif isinstance(res, (Forbidden, BadRequest, ChatMigrated)):
+            # Bot bloklangan / chat yo‘q / xabar yaroqsiz -> qayta urinish foydasiz
+            dead.append(r["id"])
+        else:
+            retry.append(r["id"])  # tarmoq/timeout: backoff, MAX_SEND_RETRIES ga sanaladi
+    return retry, flood, dead
+
+
+def join_messages(items):
+    """(row, body) larni MESSAGE_LIMIT dan oshmaydigan xabarlarga yig‘adi: [(rows, text), ...]."""
+    chunks = []
+    rows, parts, size = [], [], 0
+    for r, body in items:
+        if parts and size + 2 + len(body) > MESSAGE_LIMIT:
+            chunks.append((rows, "\n\n".join(parts)))
+            rows, parts, size = [], [], 0
+        rows.append(r)
+        parts.append(body)
+        size += len(body) + (2 if size else 0)
+    if parts:
+        chunks.append((rows, "\n\n".join(parts)))
+    return chunks
+
+
+async def send_chat(app, chat_id: int, items) -> list[tuple]:
+    """Bir chat'ning due eslatmalarini birlashtirib yuboradi. Qaytaradi: [(row, xato yoki None), ...].
+       Xatodan keyin qolgan xabarlar yuborilmaydi (blok/flood bo‘lsa bari baribir yiqiladi).
+    """
+    out = []
+    error = None
+    for rows, text in join_messages(items):
+        if error is None:
+            try:
+                # Global tezlikni app.bot'dagi AIORateLimiter cheklaydi
+                await app.bot.send_message(chat_id=chat_id, text=text, parse_mode=ParseMode.HTML)
+            except Exception as e:
+                error = e
+        out.extend((r, error) for r in rows)
+    return out
+
+
+async def requeue(conn, retry: list[int], flood: dict[int, float], dead: list[int]):
+    """Tarmoq xatolarini backoff bilan (MAX_SEND_RETRIES gacha), RetryAfter'larni sanamasdan
+       qayta navbatga qo‘yadi; qolganlarini failed_at bilan belgilaydi.
+    """
+    if not retry and not flood and not dead:
+        return
+    ids = [*retry, *flood]
+    async with conn.transaction():
+        if ids:
+            await conn.execute(
+                REQUEUE_SQL,
+                ids,
+                [0.0] * len(retry) + list(flood.values()),
+                [True] * len(retry) + [False] * len(flood),
+                RETRY_BASE_SECONDS,
+                RETRY_JITTER_SECONDS,
+                MAX_SEND_RETRIES,
+            )
+        await conn.execute(GIVE_UP_SQL, [*ids, *dead])
+
+
+async def next_delay(conn) -> float:
+    """Eng yaqin pending eslatmagacha qancha kutish kerak (sekund)."""
+    next_at = await conn.fetchval(NEXT_DUE_SQL)
+    if next_at is None:
+        return MAX_SLEEP_SECONDS
+    return max(1.0, min(MAX_SLEEP_SECONDS, (next_at - now_utc()).total_seconds()))
+
+
+async def purge_sent(conn):
+    """SENT_RETENTION_DAYS dan eski yuborilgan va FAILED_RETENTION_DAYS dan eski yetkazilmagan
+       eslatmalarni o‘chiradi (jadval va indexlar o‘smasin).
+       PURGE_BATCH_SIZE lik bo‘laklarda: birinchi marta butun tarix bo‘lsa ham timeout bo‘lmaydi.
+    """
+    total, last_id = 0, 0
+    while True:
+        row = await conn.fetchrow(
+            PURGE_SQL, SENT_RETENTION_DAYS, FAILED_RETENTION_DAYS, last_id, PURGE_BATCH_SIZE
+        )
+        total += row["n"]
+        if row["n"] < PURGE_BATCH_SIZE:
+            break
+        last_id = row["last_id"]
+    logger.info("Purge: %s ta eslatma o‘chirildi", total)
+
+
+async def reminder_worker(app):
+    """Due bo‘lganlarni yuboradi, keyin eng yaqin remind_at gacha uxlaydi.
+       INSERT trigger NOTIFY qiladi -> worker LISTEN orqali darhol uyg‘onadi.
+    """
     global pool
     assert pool is not None
 
+    wakeup = asyncio.Event()
+    last_purge = None  # time.monotonic()
+
+    def on_notify(conn, pid, channel, payload):
+        wakeup.set()
+
+    def on_terminate(conn):
+        # Ulanish uzildi -> uyg‘onib, yangisini olamiz (NOTIFY'lar yo‘qolmasin)
+        wakeup.set()
+
     while True:
         try:
+            # Worker bitta ulanishni butun umri davomida ushlab turadi (LISTEN ham shunda)
             async with pool.acquire() as conn:
-                async with conn.transaction():
-                    # Due bo‘lganlarini lock qilib olamiz
-                    rows = await conn.fetch(
-                        """
-                        WITH cte AS (
-                            SELECT id, chat_id, text, days_after, remind_at
-                            FROM reminders
-                            WHERE sent = FALSE AND remind_at <= NOW()
-                            ORDER BY remind_at ASC
-                            LIMIT 25
-                            FOR UPDATE SKIP LOCKED
-                        )
-                        UPDATE reminders r
-                        SET sent = TRUE, sent_at = NOW()
-                        FROM cte
-                        WHERE r.id = cte.id
-                        RETURNING cte.id, cte.chat_id, cte.text, cte.days_after, cte.remind_at
-                        """
-                    )
-
-            # Transaction tugadi -> endi yuboramiz
-            for r in rows:
-                chat_id = int(r["chat_id"])
-                text = r["text"]
-                d = int(r["days_after"])
-                ra = r["remind_at"]  # timestamptz (aware)
-                ra_local = to_local(ra)
-
-                msg = (
-                    f"⏰ <b>Takrorlash vaqti!</b>\n"
-                    f"📌 <b>{d} kun</b> eslatma\n"
-                    f"🗓 <b>{ra_local:%d.%m.%Y %H:%M}</b>\n\n"
-                    f"📝 {text}"
-                )
-                await app.bot.send_message(chat_id=chat_id, text=msg, parse_mode=ParseMode.HTML)
-
-        except Exception as e:
+                conn.add_termination_listener(on_terminate)
+                await conn.add_listener(NOTIFY_CHANNEL, on_notify)
+                while not conn.is_closed():
+                    # clear() oldin -> ishlov paytida kelgan NOTIFY yo‘qolmaydi
+                    wakeup.clear()
+                    await send_due(app, conn)
+                    if last_purge is None or time.monotonic() - last_purge >= PURGE_EVERY_SECONDS:
+                        # Oldin belgilaymiz: purge xatosi har aylanishda takrorlanmaydi
+                        last_purge = time.monotonic()
+                        try:
+                            await purge_sent(conn)
+                        except (asyncpg.PostgresError, asyncio.TimeoutError):
+                            # Yuborishga xalaqit bermasin, ertaga yana urinadi
+                            logger.exception("Purge error")
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), timeout=await next_delay(conn))
+                    except asyncio.TimeoutError:
+                        pass
+
+        except Exception:
             # worker yiqilib qolmasin
-            print("Worker error:", repr(e))
-
-        await asyncio.sleep(CHECK_EVERY_SECONDS)
+            logger.exception("Worker error")
+            await asyncio.sleep(ERROR_RETRY_SECONDS)
+
+
+# ====== TEXTS ======
+# O‘zgarmas javoblar: har so‘rovda qaytadan yig‘ilmaydi
+REMIND_DAYS_STR = ", ".join(map(str, REMIND_DAYS))
+
+START_TEXT = (
+    "🤖 Bot ishga tushdi!\n\n"
+    "Buyruqlar:\n"
+    "✅ /add <matn>  — 1/3/7/30 kunga eslatma qo‘yadi\n"
+    "📚 /add_many    — har qatordagi mavzuga eslatma qo‘yadi (yoki .txt fayl)\n"
+    "📋 /list        — saqlangan eslatmalar va qancha qolganini ko‘rsatadi\n"
+    "➡️ /list next   — ro‘yxatning keyingi sahifasi\n"
+    "⏭ /next         — eng yaqin eslatma\n"
+    "\nMisol:\n"
+    "/add Bugun o‘rgangan mavzu: Docker registry"
+)
+ADD_USAGE_TEXT = "❗ Foydalanish: /add <matn>\nMisol: /add Bugun o‘rgangan mavzu"
+ADD_MANY_USAGE_TEXT = (
+    "❗ Foydalanish: /add_many va har qatorda bitta mavzu\n"
+    "yoki caption'i /add_many bo‘lgan .txt fayl yuboring."
+)
+TOPIC_TOO_LONG_TEXT = f"❗ Mavzu juda uzun (max {MAX_TOPIC_CHARS} belgi)."
+SAVED_FOOTER = f"📅 {REMIND_DAYS_STR} kunlarda xabar beraman.\n\n📋 Ko‘rish uchun: /list"
+LIST_EMPTY_TEXT = "📭 Hozircha pending eslatma yo‘q.\nYangi qo‘shish: /add <matn>"
+LIST_END_TEXT = "📭 Ro‘yxat tugadi.\nBoshidan ko‘rish: /list"
+
+# /list javobining o‘zgarmas qismlari
+LIST_HEADER = "📋 <b>Pending eslatmalar</b> (har mavzuning eng yaqini):\n\n"
+LIST_MORE = "\n\n➡️ Davomi: /list next"
+LIST_ROW_FMT = (
+    "• <code>#{id}</code> — <b>{d} kun</b> | 🗓 {when} | ⏳ {left}\n"
+    "  📝 {text}"
+).format
+NEXT_FMT = (
+    "⏭ <b>Keyingi eslatma:</b>\n"
+    "📌 <b>{d} kun</b> | 🗓 {when} | ⏳ {left}\n"
+    "📝 {text}"
+).format
 
 
 # ====== COMMANDS ======
 async def start_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "🤖 Bot ishga tushdi!\n\n"
-        "Buyruqlar:\n"
-        "✅ /add <matn>  — 1/3/7/30 kunga eslatma qo‘yadi\n"
-        "📋 /list        — saqlangan eslatmalar va qancha qolganini ko‘rsatadi\n"
-        "\nMisol:\n"
-        "/add Bugun o‘rgangan mavzu: Docker registry"
-    )
+    await update.message.reply_text(START_TEXT)
 
 
 async def add_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         if not context.args:
-            await update.message.reply_text("❗ Foydalanish: /add <matn>\nMisol: /add Bugun o‘rgangan mavzu")
+            await update.message.reply_text(ADD_USAGE_TEXT)
             return
 
         text = " ".join(context.args).strip()
+        if len(text) > MAX_TOPIC_CHARS:
+            await update.message.reply_text(TOPIC_TOO_LONG_TEXT)
+            return
         chat_id = update.effective_chat.id
 
         n = await add_reminders(chat_id, text)
+        pending_cache.pop(chat_id, None)
 
-        await update.message.reply_text(
-            f"✅ Saqlandi! ({n} ta eslatma)\n"
-            f"📅 {', '.join(map(str, REMIND_DAYS))} kunlarda xabar beraman.\n\n"
-            f"📋 Ko‘rish uchun: /list"
-        )
+        await update.message.reply_text(f"✅ Saqlandi! ({n} ta eslatma)\n" + SAVED_FOOTER)
 
     except Exception as e:
-        print("add_cmd error:", repr(e))
+        logger.exception("add_cmd error")
         await update.message.reply_text(f"❌ /add xato: {type(e).__name__}")
 
 
+async def add_many_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        msg = update.message
+        if msg.document:
+            # Caption'da /add_many bo‘lgan .txt fayl (handler faqat text/plain ni o‘tkazadi)
+            if (msg.document.file_size or 0) > MAX_BULK_FILE_BYTES:
+                await msg.reply_text(f"❗ Fayl juda katta (max {MAX_BULK_FILE_BYTES // 1024} KB)")
+                return
+            f = await msg.document.get_file()
+            body = (await f.download_as_bytearray()).decode("utf-8", errors="replace")
+        else:
+            # Buyruqdan keyingi qatorlar
+            parts = (msg.text or "").split(None, 1)
+            body = parts[1] if len(parts) > 1 else ""
+
+        texts = [line.strip() for line in body.splitlines() if line.strip()]
+        if not texts:
+            await msg.reply_text(ADD_MANY_USAGE_TEXT)
+            return
+        if len(texts) > MAX_BULK_TOPICS:
+            await msg.reply_text(f"❗ Ko‘pi bilan {MAX_BULK_TOPICS} ta mavzu qo‘shish mumkin.")
+            return
+        # Uzun qator Telegram'da hech qachon yuborilmaydi -> oldindan rad etamiz
+        too_long = [i for i, line in enumerate(body.splitlines(), 1) if len(line.strip()) > MAX_TOPIC_CHARS]
+        if too_long:
+            await msg.reply_text(f"{TOPIC_TOO_LONG_TEXT}\nQatorlar: {', '.join(map(str, too_long[:10]))}")
+            return
+
+        n = await bulk_add(update.effective_chat.id, texts)
+        pending_cache.pop(update.effective_chat.id, None)
+
+        await msg.reply_text(f"✅ Saqlandi! ({len(texts)} ta mavzu, {n} ta eslatma)\n" + SAVED_FOOTER)
+
+    except Exception as e:
+        logger.exception("add_many_cmd error")
+        await update.message.reply_text(f"❌ /add_many xato: {type(e).__name__}")
+
+
+def list_row(r, now_ts: int) -> str:
+    text = r["text"]
+    ts = r["ts"]  # unix sekund -> faqat int arifmetika
+    short = html.escape(text if len(text) <= 60 else text[:57] + "…")
+    # remind_local ni DB o‘zi mahalliy vaqtda formatlab beradi
+    return LIST_ROW_FMT(
+        id=r["id"], d=r["days_after"], when=r["remind_local"], left=human_left(ts, now_ts), text=short
+    )
+
+
 async def list_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         chat_id = update.effective_chat.id
-        rows = await fetch_pending(chat_id)
+        # /list -> boshidan, /list next -> oldingi sahifa tugagan joydan
+        after = None
+        if context.args and context.args[0].lower() == "next":
+            # Oxirgi sahifa ko‘rsatilgan -> 1-sahifaga qaytmaymiz
+            if context.chat_data.get("list_done"):
+                await update.message.reply_text(LIST_END_TEXT)
+                return
+            after = context.chat_data.get("list_cursor")
+
+        rows = await fetch_pending(chat_id, after)
+        has_more = len(rows) > LIST_PAGE_SIZE
+        rows = rows[:LIST_PAGE_SIZE]
 
         if not rows:
-            await update.message.reply_text("📭 Hozircha pending eslatma yo‘q.\nYangi qo‘shish: /add <matn>")
+            context.chat_data.pop("list_cursor", None)
+            context.chat_data["list_done"] = True
+            if after is not None:
+                await update.message.reply_text(LIST_END_TEXT)
+                return
+            await update.message.reply_text(LIST_EMPTY_TEXT)
             return
 
-        now = now_utc()
-        lines = ["📋 <b>Pending eslatmalar:</b>\n"]
-        for r in rows:
-            rid = r["id"]
-            text = r["text"]
-            d = int(r["days_after"])
-            ra = r["remind_at"]
-            left = ra - now
-            # Qolgan vaqtni “kun/soat” ko‘rinishda chiqaramiz
-            total_seconds = int(left.total_seconds())
-            if total_seconds < 0:
-                remain_str = "hozir"
-            else:
-                days = total_seconds // 86400
-                hours = (total_seconds % 86400) // 3600
-                if days > 0:
-                    remain_str = f"{days} kun {hours} soat"
-                else:
-                    remain_str = f"{hours} soat"
-
-            ra_local = to_local(ra)
-            short = text if len(text) <= 60 else text[:57] + "…"
-            lines.append(
-                f"• <code>#{rid}</code> — <b>{d} kun</b> | "
-                f"🗓 {ra_local:%d.%m.%Y %H:%M} | ⏳ {remain_str}\n"
-                f"  📝 {short}"
-            )
+        now_ts = int(time.time())
+        body = "\n".join(list_row(r, now_ts) for r in rows)
+
+        if has_more:
+            last = rows[-1]
+            context.chat_data["list_cursor"] = (last["remind_at"], last["id"])
+            context.chat_data["list_done"] = False
+            msg = LIST_HEADER + body + LIST_MORE
+        else:
+            context.chat_data.pop("list_cursor", None)
+            context.chat_data["list_done"] = True
+            msg = LIST_HEADER + body
 
-        await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+        await update.message.reply_text(msg, parse_mode=ParseMode.HTML)
 
     except Exception as e:
-        print("list_cmd error:", repr(e))
+        logger.exception("list_cmd error")
         await update.message.reply_text(f"❌ /list xato: {type(e).__name__}")
 
 
+async def next_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        r = await next_pending_row(update.effective_chat.id)
+        if r is None:
+            await update.message.reply_text(LIST_EMPTY_TEXT)
+            return
+
+        msg = NEXT_FMT(
+            d=r["days_after"], when=r["remind_local"], left=human_left(r["ts"]), text=html.escape(r["text"])
+        )
+        await update.message.reply_text(msg, parse_mode=ParseMode.HTML)
+
+    except Exception as e:
+        logger.exception("next_cmd error")
+        await update.message.reply_text(f"❌ /next xato: {type(e).__name__}")
+
+
 async def post_init(app):
-    global pool
+    global pool, worker_task
     # Pool yaratamiz
-    pool = await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=5, command_timeout=60)
+    # Bo‘sh ulanishlar uzoq yashaydi -> statement cache yo‘qolmaydi
+    pool = await asyncpg.create_pool(
+        DATABASE_URL,
+        min_size=DB_POOL_MIN,
+        max_size=DB_POOL_MAX + 1,  # +1: worker ulanishi doim band
+        command_timeout=60,
+        statement_cache_size=1024,
+        max_cached_statement_lifetime=0,  # prepared statement'lar vaqt bo‘yicha eskirmaydi
+        max_inactive_connection_lifetime=3600,
+        # Kichik OLTP so‘rovlar: JIT kompilyatsiya faqat latency qo‘shadi
+        server_settings={"jit": "off"},
+    )
 
     # Schema tayyorlaymiz
     await ensure_schema()
 
-    # Background worker
-    app.create_task(reminder_worker(app))
+    # Background worker (app hali ishga tushmagan -> PTB uni o‘zi to‘xtatmaydi)
+    worker_task = asyncio.create_task(reminder_worker(app))
+
+    logger.info("🤖 Bot ishga tushdi...")
+
+
+async def post_stop(app):
+    global worker_task
+    # Worker bot HTTP client'i hali ochiq paytda to‘xtaydi (yuborilayotgan batch tugaydi).
+    # U pool'dan ulanishni qaytarmaguncha pool.close() kutib qoladi
+    if worker_task is not None:
+        worker_task.cancel()
+        try:
+            await worker_task
+        except asyncio.CancelledError:
+            pass
+        worker_task = None
+
 
-    print("🤖 Bot ishga tushdi...")
+async def post_shutdown(app):
+    global pool
+    # Pool ulanishlarini yopamiz
+    if pool is not None:
+        await pool.close()
+        pool = None
 
 
 def main():
@@ -250,20 +815,59 @@ def main():
         raise RuntimeError("BOT_TOKEN yo‘q. Railway Variables’da BOT_TOKEN qo‘shing.")
     if not DATABASE_URL:
         raise RuntimeError("DATABASE_URL yo‘q. Railway Variables’da DATABASE_URL qo‘shing.")
+    if USE_WEBHOOK and not PUBLIC_URL:
+        raise RuntimeError("PUBLIC_URL yo‘q. USE_WEBHOOK=1 bo‘lsa PUBLIC_URL (https://...) qo‘shing.")
+
+    listener = setup_logging()
+
+    # uvloop bo‘lsa run_polling/run_webhook shu loop'da ishlaydi
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+    # send_message'lar uchun: HTTP/2 -> parallel yuborishlar bitta TLS ulanishda
+    # (getUpdates o‘zining default request'ida qoladi)
+    request = HTTPXRequest(
+        connection_pool_size=64,
+        http_version="2",
+        connect_timeout=5,
+        read_timeout=10,
+    )
 
     app = (
         ApplicationBuilder()
         .token(BOT_TOKEN)
+        .request(request)
+        # max_retries=0: RetryAfter bizga qaytadi -> requeue uni remind_at orqali kechiktiradi
+        .rate_limiter(AIORateLimiter(overall_max_rate=SEND_RATE_PER_SECOND, overall_time_period=1, max_retries=0))
         .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
         .build()
     )
 
     app.add_handler(CommandHandler("start", start_cmd))
     app.add_handler(CommandHandler("add", add_cmd))
+    app.add_handler(CommandHandler("add_many", add_many_cmd))
+    app.add_handler(MessageHandler(filters.Document.TXT & filters.CaptionRegex(r"^/add_many\b"), add_many_cmd))
     app.add_handler(CommandHandler("list", list_cmd))
+    app.add_handler(CommandHandler("next", next_cmd))
 
     # IMPORTANT: asyncio.run ishlatmaymiz!
-    app.run_polling(close_loop=False)
+    try:
+        if USE_WEBHOOK:
+            app.run_webhook(
+                listen="0.0.0.0",
+                port=PORT,
+                url_path=BOT_TOKEN,
+                webhook_url=f"{PUBLIC_URL}/{BOT_TOKEN}",
+                close_loop=False,
+            )
+        else:
+            # Lokal dev uchun
+            app.run_polling(close_loop=False)
+    finally:
+        # Navbatda qolgan loglarni yozib tugatadi
+        listener.stop()
 
 
 if __name__ == "__main__":